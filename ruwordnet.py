@@ -1,7 +1,19 @@
-import lxml
+import functools
+import glob
+import os
+import pickle
+import sys
+import tempfile
+import weakref
+from collections import defaultdict
 from lxml import etree
-from tqdm import tqdm_notebook
-from typing import List, Tuple, Dict, Union
+from typing import List, Tuple, Dict, Union, Iterator, Optional
+
+_CACHE = 'data/ruwordnet.pkl'
+# Should be increased whenever the set of cached attributes changes
+_CACHE_VERSION = 1
+# Maximal number of memorized results for each of the query methods
+_QUERY_CACHE_SIZE = 100000
 
 
 class RuWordNetInfo:
@@ -11,88 +23,211 @@ class RuWordNetInfo:
 
     def __init__(self):
 
-        senses_file_n = 'data/senses.N.xml'
-        senses_file_v = 'data/senses.V.xml'
-        senses_file_a = 'data/senses.A.xml'
+        # Parsed data is cached on disk, xml-files are parsed again if any of them was added, removed or changed
+        try:
+            xml_files = self.fingerprint(glob.glob('data/*.xml'))
+        except OSError:
+            xml_files = None
 
-        synsets_n = 'data/synsets.N.xml'
-        synsets_v = 'data/synsets.V.xml'
-        synsets_a = 'data/synsets.A.xml'
+        cached = self.load_cache(_CACHE, xml_files) if xml_files is not None else None
+        if cached is not None:
+            self.__dict__.update(cached)
+        else:
+            self.parse_xml_files()
+            if xml_files is not None:
+                self.save_cache(_CACHE, self.__dict__, xml_files)
+
+        # Memorized query results are kept per instance (a cache on the class would keep every instance alive).
+        # They are created after saving the cache, so they never get into the pickle. Only immutable values
+        # are memorized, the public methods build new lists and dictionaries from them on every call.
+        # The cached functions refer to the instance through a weak proxy, otherwise the instance would be
+        # in a reference cycle and its dictionaries would be freed only by the garbage collector
+        proxy = weakref.proxy(self)
+        self._synonyms_cache = functools.lru_cache(maxsize=_QUERY_CACHE_SIZE)(
+            functools.partial(RuWordNetInfo._show_synonyms, proxy))
+        self._relations_cache = functools.lru_cache(maxsize=_QUERY_CACHE_SIZE)(
+            functools.partial(RuWordNetInfo._synset_relations_with_words, proxy))
 
-        relations_file_names = ['data/synset_relations.N.xml', 'data/synset_relations.A.xml',
-                                'data/synset_relations.V.xml']
+    @staticmethod
+    def fingerprint(files: List[str]) -> List[Tuple[str, int, int]]:
+        """
+        Describe files by their names, sizes and modification times
+        :param files: list of file names
+        :return: sorted list of (file name, size, modification time in ns)
+        """
+        fingerprint = []
+        for file in sorted(files):
+            stat = os.stat(file)
+            fingerprint.append((file, stat.st_size, stat.st_mtime_ns))
+        return fingerprint
 
-        # Loading xml files
-        self.senses_N = self.load_xml(senses_file_n)
-        self.senses_V = self.load_xml(senses_file_v)
-        self.senses_A = self.load_xml(senses_file_a)
+    @staticmethod
+    def save_cache(cache_file: str, data: Dict, xml_files: List[Tuple[str, int, int]]):
+        """
+        Save attributes to the cache file. The data is written to a temporary file first and then moved
+        in place, so an interrupted write never leaves a broken cache behind
+        :param cache_file: cache file name
+        :param data: dictionary with attributes
+        :param xml_files: fingerprint of the xml-files the data was parsed from
+        """
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix='.tmp')
+        except OSError:
+            # Data folder is not writable, the thesaurus will be parsed again next time
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'version': _CACHE_VERSION, 'xml_files': xml_files, 'data': data}, f, protocol=5)
+
+            # mkstemp creates files readable only by the owner, the cache should be readable like a usual file
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_file, 0o644 & ~umask)
+
+            os.replace(tmp_file, cache_file)
+        except BaseException as e:
+            os.remove(tmp_file)
+            # Failed write (e.g., no space left) only means that there is no cache, anything else is re-raised
+            if not isinstance(e, OSError):
+                raise
 
-        self.synsets_N = self.load_xml(synsets_n)
-        self.synsets_V = self.load_xml(synsets_v)
-        self.synsets_A = self.load_xml(synsets_a)
+    @staticmethod
+    def load_cache(cache_file: str, xml_files: List[Tuple[str, int, int]]) -> Optional[Dict]:
+        """
+        Load cached attributes if the cache file was built from exactly the same xml-files
+        by the current version of the class
+        :param cache_file: cache file name
+        :param xml_files: fingerprint of the current xml-files
+        :return: dictionary with attributes or None if the cache can't be used
+        """
+        if not os.path.exists(cache_file):
+            return None
+
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception:
+            # Unreadable or broken cache file, the xml-files will be parsed again and the cache will be overwritten
+            return None
+
+        if not isinstance(cached, dict) or cached.get('version') != _CACHE_VERSION or \
+                cached.get('xml_files') != xml_files or not isinstance(cached.get('data'), dict):
+            return None
+        return cached['data']
+
+    def parse_xml_files(self):
+        """
+        Parse xml-files of the thesaurus and create all the dictionaries
+        """
 
-        # Creating dictionary mappings from words to synsets and from synsets to words
-        self.word_synset_N, self.synset_word_N = self.create_word_synset_map(self.senses_N)
-        self.word_synset_V, self.synset_word_V = self.create_word_synset_map(self.senses_V)
-        self.word_synset_A, self.synset_word_A = self.create_word_synset_map(self.senses_A)
+        # {part of speech: (senses file, synsets file)}
+        pos_files = {'Noun': ('data/senses.N.xml', 'data/synsets.N.xml'),
+                     'Verb': ('data/senses.V.xml', 'data/synsets.V.xml'),
+                     'Adj': ('data/senses.A.xml', 'data/synsets.A.xml')}
 
-        # Creating dictionaries with synsets definitions
-        self.defin_N = self.extract_synset_definitions(self.synsets_N)
-        self.defin_V = self.extract_synset_definitions(self.synsets_V)
-        self.defin_A = self.extract_synset_definitions(self.synsets_A)
+        relations_file_names = ['data/synset_relations.N.xml', 'data/synset_relations.A.xml',
+                                'data/synset_relations.V.xml']
+
+        # Synset ids are unique across parts of speech (they start with N, V or A), so all parts of speech share
+        # the same dictionaries. Polysemous and monosemous words are kept per part of speech:
+        # {'Noun': {'lemmas': {lemma: None}, 'names': {name: None}}}
+        word_synset = defaultdict(list)
+        self.synset_word = {}
+        self.defin = {}
+        self.polysemous = {}
+        self.monosemous = {}
+
+        for pos, (senses_file, synsets_file) in pos_files.items():
+            # Creating dictionary mappings from words to synsets and from synsets to words
+            word_synset_pos, synset_word_pos, self.polysemous[pos], self.monosemous[pos] = \
+                self.create_word_synset_map(self.stream_children(senses_file, 'sense',
+                                                                 ('synset_id', 'name', 'lemma', 'meaning')))
+
+            # The same word may belong to several parts of speech
+            for word, synsets in word_synset_pos.items():
+                word_synset[word].extend(synsets)
+            self.synset_word.update(synset_word_pos)
+
+            # Creating dictionaries with synsets definitions
+            self.defin.update(self.extract_synset_definitions(
+                self.stream_children(synsets_file, 'synset', ('id', 'ruthes_name', 'definition'))))
+
+        # Tuples can't be changed by the code that gets them from the lookup methods
+        self.word_synset = {word: tuple(synsets) for word, synsets in word_synset.items()}
 
         # Dictionary with the closest synset relations
         self.basic_relations = self.get_basic_relations(relations_file_names)
 
     @staticmethod
-    def load_xml(file: str) -> lxml.etree._Element:
+    def stream_children(file: str, tag: str, attributes: Tuple[str, ...]) -> Iterator[Tuple[str, ...]]:
         """
-        Load xml-file
+        Stream xml-file and yield attributes of its elements one by one (the whole tree is never kept in memory)
         :param file: file name
-        :return: processed xml-file
+        :param tag: tag of the elements of interest (e.g., 'sense', 'synset', 'relation')
+        :param attributes: names of the attributes to extract, other attributes are not read at all
+        :return: iterator over tuples with values of the given attributes
         """
-        doc = etree.parse(file)
-        root = doc.getroot()
-        return root
+        for _, elem in etree.iterparse(file, events=('end',), tag=tag):
+            # elem.get is looked up once per element, the attributes are read without a Python-level loop
+            yield tuple(map(elem.get, attributes))
+
+            # Free the processed element and its already processed siblings
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
 
     @staticmethod
-    def create_word_synset_map(senses: lxml.etree._Element) -> Tuple[Dict, Dict]:
+    def create_word_synset_map(senses: Iterator[Tuple[str, str, str, str]]) -> Tuple[Dict, Dict, Dict, Dict]:
 
         """
-        Create dictionaries with the following maps: from words to synsets and from synsets to words
-        :param senses: loaded xml-file with senses
-        :return: two dictionaries: {words: synsets} and {synset: words}
+        Create dictionaries with the following maps: from words to synsets and from synsets to words.
+        Polysemous and monosemous words are collected along the way
+        :param senses: (synset_id, name, lemma, meaning) attributes of senses streamed from xml-file
+        :return: four dictionaries: {words: synsets}, {synset: tuple of words}, polysemous and monosemous words
+        of the format {'lemmas': {lemma: None}, 'names': {unlemmatized word: None}} (dictionaries are used
+        as sets that keep the order in which the words appear in the file)
         """
 
-        synset_dict = {}
-        synonyms = {}
-
-        for child in senses:
-            name = child.attrib['name'].lower()
-
-            if name not in synset_dict.keys():
-                synset_dict[name] = []
-            synset_dict[name].append(child.attrib['synset_id'])
+        synset_dict = defaultdict(list)
+        synonyms = defaultdict(list)
+        polysemous = {'lemmas': {}, 'names': {}}
+        monosemous = {'lemmas': {}, 'names': {}}
+
+        for synset_id, name, lemma, meaning in senses:
+            # Synset ids are repeated across all the dictionaries, so they are interned (words are not)
+            synset_id = sys.intern(synset_id)
+            # Lemma mostly coincides with the word itself, then the word is lowercased only once
+            if lemma == name:
+                name = lemma = name.lower()
+            else:
+                name, lemma = name.lower(), lemma.lower()
 
-            if child.attrib['synset_id'] not in synonyms.keys():
-                synonyms[child.attrib['synset_id']] = []
+            if meaning == '1':
+                monosemous['lemmas'][lemma] = None
+                monosemous['names'][name] = None
+            else:
+                polysemous['lemmas'][lemma] = None
+                polysemous['names'][name] = None
 
-            synonyms[child.attrib['synset_id']].append(name)
+            synset_dict[name].append(synset_id)
+            synonyms[synset_id].append(name)
 
-        return synset_dict, synonyms
+        # Tuples can't be changed by the code that gets them from the lookup methods
+        return dict(synset_dict), {synset_id: tuple(words) for synset_id, words in synonyms.items()}, \
+            polysemous, monosemous
 
     @staticmethod
-    def extract_synset_definitions(synsets: lxml.etree._Element) -> Dict:
+    def extract_synset_definitions(synsets: Iterator[Tuple[str, str, str]]) -> Dict:
         """
         Extract synset definitipns from xml-file
-        :param synsets: synsets xml-file
+        :param synsets: (id, ruthes_name, definition) attributes of synsets streamed from xml-file
         :return: dictionary with ruthes names and definitions
         """
 
         definitions = {}
-        for child in synsets:
-            definitions[child.attrib['id']] = {'ruthes_name': child.attrib['ruthes_name'],
-                                               'definition': child.attrib['definition']}
+        for synset_id, ruthes_name, definition in synsets:
+            definitions[sys.intern(synset_id)] = {'ruthes_name': ruthes_name, 'definition': definition}
         return definitions
 
     def get_basic_relations(self, relations_files: List[str]) -> Dict:
@@ -100,32 +235,24 @@ class RuWordNetInfo:
         """
         Create dictionary with synsets as keys and all the close relations as values
         :param relations_files: list of synset relations file names
-        :return: dictionary of the following format: {'N12658': {'hypernym': ['N37195', 'N14084'],
-        'part holonym': ['N35721'], 'POS-synonymy': ['V46672']}, ...}
+        :return: dictionary of the following format: {'N12658': {'hypernym': ('N37195', 'N14084'),
+        'part holonym': ('N35721',), 'POS-synonymy': ('V46672',)}, ...}
         """
 
-        relatives_dict_new = {}
+        relatives_dict_new = defaultdict(lambda: defaultdict(list))
 
         for file in relations_files:
-            root = self.load_xml(file)
-            par_id_prev = ''  # previous parent_id
-            for child in root:
-
-                if par_id_prev == child.attrib['parent_id']:
-                    if child.attrib['name'] in relatives_dict_new[child.attrib['parent_id']].keys():
-                        relatives_dict_new[child.attrib['parent_id']][child.attrib['name']].append(
-                            child.attrib['child_id'])
-                    else:
-                        relatives_dict_new[child.attrib['parent_id']][child.attrib['name']] = [child.attrib['child_id']]
-                        par_id_prev = child.attrib['parent_id']
-
-                else:
-                    relatives_dict_new[child.attrib['parent_id']] = {}
+            for parent_id, child_id, name in self.stream_children(file, 'relation', ('parent_id', 'child_id', 'name')):
+                # Synset ids and relation names come from a small vocabulary repeated over and over
+                parent_id = sys.intern(parent_id)
+                child_id = sys.intern(child_id)
+                name = sys.intern(name)
 
-                    relatives_dict_new[child.attrib['parent_id']][child.attrib['name']] = [child.attrib['child_id']]
-                    par_id_prev = child.attrib['parent_id']
+                relatives_dict_new[parent_id][name].append(child_id)
 
-        return relatives_dict_new
+        # Tuples take less memory than lists and can't be changed by the code that gets them
+        return {parent_id: {name: tuple(child_ids) for name, child_ids in relatives.items()}
+                for parent_id, relatives in relatives_dict_new.items()}
 
     def extract_word_synset_number(self, word: str, full_info: bool = False) -> List:
 
@@ -136,14 +263,8 @@ class RuWordNetInfo:
         :return: list of synsets (optionally with additional info)
         """
 
-        if word in self.word_synset_N.keys():
-            synsets = self.word_synset_N[word]
-
-        elif word in self.word_synset_V.keys():
-            synsets = self.word_synset_V[word]
-
-        elif word in self.word_synset_A.keys():
-            synsets = self.word_synset_A[word]
+        if word in self.word_synset:
+            synsets = self.word_synset[word]
         else:
             return ['No such word in RuWordNet']
 
@@ -155,7 +276,7 @@ class RuWordNetInfo:
                 output_info.append([syn, synset_info])
             return output_info
         else:
-            return synsets
+            return list(synsets)
 
     def show_synset_definitions(self, synset_number: str) -> Dict:
 
@@ -165,80 +286,70 @@ class RuWordNetInfo:
         :return: dictionary like this {'ruthes_name': 'КОДИРОВАНИЕ ОТ ЗАВИСИМОСТИ', 'definition': ''}
         """
 
-        if synset_number in self.defin_N.keys():
-            return self.defin_N[synset_number]
-
-        elif synset_number in self.defin_N.keys():
-            return self.defin_N[synset_number]
-
-        elif synset_number in self.defin_N.keys():
-            return self.defin_N[synset_number]
+        return dict(self.defin.get(synset_number, {}))
 
-        else:
-            return {}
-
-    def show_synset_words(self, synset_number: str) -> List[str]:
+    def show_synset_words(self, synset_number: str) -> Tuple[str, ...]:
 
         """
         Print all the words from a given synset (synonyms)
         :param synset_number: synset id
-        :return: list of words
+        :return: tuple of words
         """
 
-        if synset_number in self.synset_word_N.keys():
-            return self.synset_word_N[synset_number]
-
-        elif synset_number in self.synset_word_V.keys():
-            return self.synset_word_V[synset_number]
-
-        elif synset_number in self.synset_word_A.keys():
-            return self.synset_word_A[synset_number]
-
+        if synset_number in self.synset_word:
+            return self.synset_word[synset_number]
         else:
-            return ['No such synset in the thesaurus']
+            return ('No such synset in the thesaurus',)
 
     def show_synonyms(self, word: str) -> Union[List[Dict], str]:
 
         """
         Extract synonyms for a given word
         :param word: word for which we want to find synonyms
-        :return: list of synonyms with synset info: [{'synset_id': 'N29948', 'synonyms': ['ножка'],
+        :return: list of synonyms with synset info: [{'synset_id': 'N29948', 'synonyms': ('ножка',),
         'ruthes_name': 'НОГА (НИЖНЯЯ КОНЕЧНОСТЬ)'}]
         """
 
-        if word in self.word_synset_N.keys():
-            synsets = self.word_synset_N[word]
+        synonyms_info = self._synonyms_cache(word)
+        if synonyms_info is None:
+            return 'No such word in RuWordNet'
 
-        elif word in self.word_synset_V.keys():
-            synsets = self.word_synset_V[word]
+        return [{'synset_id': syn, 'synonyms': synonyms, 'ruthes_name': defin}
+                for syn, synonyms, defin in synonyms_info]
 
-        elif word in self.word_synset_A.keys():
-            synsets = self.word_synset_A[word]
+    def _show_synonyms(self, word: str) -> Optional[Tuple[Tuple[str, Tuple[str, ...], str], ...]]:
+        """
+        Extract synonyms for a given word (results are memorized in _synonyms_cache)
+        :param word: word for which we want to find synonyms
+        :return: tuple of (synset_id, synonyms, ruthes_name) or None if there is no such word
+        """
 
+        if word in self.word_synset:
+            synsets = self.word_synset[word]
         else:
-            return 'No such word in RuWordNet'
+            return None
 
         output_info = []
 
         for syn in synsets:
-            synonyms = self.show_synset_words(syn)
-            if word in synonyms:
-                synonyms.remove(word)
+            synonyms = tuple(synonym for synonym in self.show_synset_words(syn) if synonym != word)
 
             defin = self.show_synset_definitions(syn)['ruthes_name']
-            output_info.append({'synset_id': syn, 'synonyms': synonyms, 'ruthes_name': defin})
+            output_info.append((syn, synonyms, defin))
 
-        return output_info
+        return tuple(output_info)
 
     def show_basic_synset_relations(self, synset_number: str) -> Dict:
         """
         Show synsets that are connected to the synset under consideration
         :param synset_number: synset id
-        :return: dictionary with relations that connect this synset to others (the most close ones)
+        :return: dictionary with relations that connect this synset to others (the most close ones),
+        related synsets are given as tuples: {'hypernym': ('N37195', 'N14084'), 'domain': ('N30873',)}
         """
 
         if synset_number in self.basic_relations:
-            return self.basic_relations[synset_number]
+            # Shallow copy, the values are tuples
+            return dict(self.basic_relations[synset_number])
         else:
             return {}
 
@@ -259,6 +370,27 @@ class RuWordNetInfo:
         'domain': {'N30873': ['медицина', 'медицинская сфера']}}
         """
 
+        relatives_words = dict(self._relations_cache(synset_number, print_synsets))
+        if relations != 'all':
+            relatives_words = {relation: relatives_words[relation] for relation in relations if
+                               relation in relatives_words}
+
+        # New lists and dictionaries are built from the memorized tuples, so changing them doesn't affect the cache
+        if print_synsets:
+            return {relation: {syn: list(words) for syn, words in synsets}
+                    for relation, synsets in relatives_words.items()}
+        else:
+            return {relation: list(words) for relation, words in relatives_words.items()}
+
+    def _synset_relations_with_words(self, synset_number: str, print_synsets: bool) -> Tuple:
+        """
+        Show the words that are connected to a synset with all the closest relations
+        (results are memorized in _relations_cache)
+        :param synset_number: synset id
+        :param print_synsets: show which words belong to which synsets
+        :return: tuple of (relation, words) or, if print_synsets, of (relation, ((synset, words), ...))
+        """
+
         relatives_dict = self.show_basic_synset_relations(synset_number)
         if relatives_dict != {}:
 
@@ -282,14 +414,13 @@ class RuWordNetInfo:
 
                         relatives_dict_words[relation].extend(self.show_synset_words(syn))
         else:
-            return {}
+            return ()
 
-        if relations == 'all':
-            return relatives_dict_words
+        if print_synsets:
+            return tuple((relation, tuple((syn, tuple(words)) for syn, words in synsets.items()))
+                         for relation, synsets in relatives_dict_words.items())
         else:
-            final_dict = {relation: relatives_dict_words[relation] for relation in relations if
-                          relation in relatives_dict_words}
-            return final_dict
+            return tuple((relation, tuple(words)) for relation, words in relatives_dict_words.items())
 
     def show_word_closest_relatives(self, word: str, synset: str = '', relations: Union[List[str], str] = 'all',
                                     print_synsets: bool = False):
@@ -344,31 +475,14 @@ class RuWordNetInfo:
         :return: list of polysemous words
         """
 
-        poly_words = []
-
-        if pos == 'Noun':
-            senses = self.senses_N
-        elif pos == 'Verb':
-            senses = self.senses_V
-        elif pos == 'Adj':
-            senses = self.senses_A
-        else:
+        if pos not in self.polysemous:
             print('Invalid POS-tag')
             return []
 
-        for child in tqdm_notebook(senses):
-
-            mean = child.attrib['meaning']
-
-            if output == 'lemmas':
-                name = child.attrib['lemma'].lower()
-            else:
-                name = child.attrib['name'].lower()
-
-            if name not in poly_words and mean != '1':
-                poly_words.append(name)
-
-        return poly_words
+        if output == 'lemmas':
+            return list(self.polysemous[pos]['lemmas'])
+        else:
+            return list(self.polysemous[pos]['names'])
 
     def extract_monosesmous_words(self, pos: str = 'Noun', output: str = 'lemmas') -> List:
         """
@@ -378,29 +492,11 @@ class RuWordNetInfo:
         :return: list of monosemous words
         """
 
-        mono_words = []
-
-        if pos == 'Noun':
-            senses = self.senses_N
-        elif pos == 'Verb':
-            senses = self.senses_V
-        elif pos == 'Adj':
-            senses = self.senses_A
-        else:
+        if pos not in self.monosemous:
             print('Invalid POS-tag')
             return []
 
-        for child in tqdm_notebook(senses):
-
-            mean = child.attrib['meaning']
-
-            if output == 'lemmas':
-                name = child.attrib['lemma'].lower()
-            else:
-                name = child.attrib['name'].lower()
-
-            if name not in mono_words and mean == '1':
-                mono_words.append(name)
-
-        return mono_words
-
+        if output == 'lemmas':
+            return list(self.monosemous[pos]['lemmas'])
+        else:
+            return list(self.monosemous[pos]['names'])
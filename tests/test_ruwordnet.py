@@ -0,0 +1,121 @@
+import glob
+import os
+
+import pytest
+
+from ruwordnet import RuWordNetInfo
+
+SENSES = {
+    'N': '''<senses>
+  <sense id="1" synset_id="N1" name="ЛУК" lemma="ЛУК" main_word="" synt_type="N" poses="N" meaning="1"/>
+  <sense id="2" synset_id="N2" name="ЛУК" lemma="ЛУК" main_word="" synt_type="N" poses="N" meaning="2"/>
+  <sense id="3" synset_id="N2" name="ЛУЧОК" lemma="ЛУЧОК" main_word="" synt_type="N" poses="N" meaning="1"/>
+  <sense id="4" synset_id="N3" name="ОРУЖИЕ" lemma="ОРУЖИЕ" main_word="" synt_type="N" poses="N" meaning="1"/>
+</senses>''',
+    'V': '''<senses>
+  <sense id="5" synset_id="V1" name="СТРЕЛЯТЬ" lemma="СТРЕЛЯТЬ" main_word="" synt_type="V" poses="V" meaning="1"/>
+</senses>''',
+    'A': '''<senses>
+  <sense id="6" synset_id="A1" name="ЛУКОВЫЙ" lemma="ЛУКОВЫЙ" main_word="" synt_type="Adj" poses="Adj" meaning="1"/>
+</senses>''',
+}
+
+SYNSETS = {
+    'N': '''<synsets>
+  <synset id="N1" ruthes_name="ЛУК (ОРУЖИЕ)" definition="оружие для метания стрел" part_of_speech="N">
+    <sense id="1">лук</sense>
+  </synset>
+  <synset id="N2" ruthes_name="ЛУК (ОВОЩ)" definition="" part_of_speech="N">
+    <sense id="2">лук</sense>
+    <sense id="3">лучок</sense>
+  </synset>
+  <synset id="N3" ruthes_name="ОРУЖИЕ" definition="" part_of_speech="N">
+    <sense id="4">оружие</sense>
+  </synset>
+</synsets>''',
+    'V': '''<synsets>
+  <synset id="V1" ruthes_name="СТРЕЛЯТЬ" definition="производить выстрелы" part_of_speech="V">
+    <sense id="5">стрелять</sense>
+  </synset>
+</synsets>''',
+    'A': '''<synsets>
+  <synset id="A1" ruthes_name="ЛУКОВЫЙ" definition="" part_of_speech="Adj">
+    <sense id="6">луковый</sense>
+  </synset>
+</synsets>''',
+}
+
+# N1 has relations in two different files
+RELATIONS = {
+    'N': '''<relations>
+  <relation parent_id="N1" child_id="N3" name="hypernym"/>
+  <relation parent_id="N2" child_id="N1" name="domain"/>
+</relations>''',
+    'V': '''<relations>
+  <relation parent_id="N1" child_id="V1" name="POS-synonymy"/>
+</relations>''',
+    'A': '''<relations>
+  <relation parent_id="A1" child_id="N2" name="POS-synonymy"/>
+</relations>''',
+}
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    data = tmp_path / 'data'
+    data.mkdir()
+    for pos in 'NVA':
+        (data / f'senses.{pos}.xml').write_text(SENSES[pos], encoding='utf-8')
+        (data / f'synsets.{pos}.xml').write_text(SYNSETS[pos], encoding='utf-8')
+        (data / f'synset_relations.{pos}.xml').write_text(RELATIONS[pos], encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    return data
+
+
+def test_relations_from_several_files_are_merged(data_dir):
+    ruw = RuWordNetInfo()
+    assert ruw.show_basic_synset_relations('N1') == {'hypernym': ('N3',), 'POS-synonymy': ('V1',)}
+
+
+def test_definitions_of_verbs_and_adjectives(data_dir):
+    ruw = RuWordNetInfo()
+    assert ruw.show_synset_definitions('V1') == {'ruthes_name': 'СТРЕЛЯТЬ', 'definition': 'производить выстрелы'}
+    assert ruw.show_synset_definitions('A1')['ruthes_name'] == 'ЛУКОВЫЙ'
+
+
+def test_show_synonyms_does_not_change_stored_words(data_dir):
+    ruw = RuWordNetInfo()
+    ruw.show_synonyms('лук')
+    assert ruw.show_synset_words('N2') == ('лук', 'лучок')
+
+    ruw.extract_word_synset_number('лук').clear()
+    assert ruw.extract_word_synset_number('лук') == ['N1', 'N2']
+
+
+def test_broken_cache_is_rebuilt(data_dir):
+    RuWordNetInfo()
+    cache = data_dir / 'ruwordnet.pkl'
+    cache.write_bytes(cache.read_bytes()[:100])
+
+    assert RuWordNetInfo().extract_word_synset_number('лук') == ['N1', 'N2']
+    # The cache is written again and can be used by the next start
+    xml_files = RuWordNetInfo.fingerprint(glob.glob('data/*.xml'))
+    assert RuWordNetInfo.load_cache('data/ruwordnet.pkl', xml_files) is not None
+
+
+def test_cache_of_other_xml_files_is_not_used(data_dir):
+    RuWordNetInfo()
+    senses = data_dir / 'senses.V.xml'
+    stat = senses.stat()
+    senses.write_text(SENSES['V'].replace('СТРЕЛЯТЬ', 'ПАЛИТЬ'), encoding='utf-8')
+    # New release unpacked with timestamps older than the cache
+    os.utime(senses, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10 ** 12))
+
+    assert RuWordNetInfo().extract_word_synset_number('палить') == ['V1']
+
+
+def test_cache_is_readable_by_other_users(data_dir):
+    RuWordNetInfo()
+    umask = os.umask(0)
+    os.umask(umask)
+    assert (data_dir / 'ruwordnet.pkl').stat().st_mode & 0o777 == 0o644 & ~umask